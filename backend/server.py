@@ -3,17 +3,30 @@ from fastapi.responses import RedirectResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError, DuplicateKeyError
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from cachetools import TTLCache
 import os
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional
 import uuid
 from datetime import datetime
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import random
 import string
-import validators
+import re
+import ipaddress
+from urllib.parse import urlsplit
 import qrcode
+import qrcode.exceptions
+import qrcode.image.svg
 from io import BytesIO
 import base64
 
@@ -26,6 +39,13 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# In-process cache for short_code -> original_url, bounded in size and age
+URL_CACHE = TTLCache(maxsize=10_000, ttl=300)
+
+# Redis cache for short_code -> original_url lookups (optional)
+redis_url = os.environ.get('REDIS_URL')
+redis_client = Redis.from_url(redis_url, decode_responses=True) if redis_url else None
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -42,7 +62,7 @@ class UrlResponse(BaseModel):
     original_url: str
     short_code: str
     short_url: str
-    qr_code: str  # Base64 encoded QR code image
+    qr_code: str  # Base64 encoded QR code SVG image
     created_at: datetime = Field(default_factory=datetime.utcnow)
     click_count: int = 0
 
@@ -54,49 +74,146 @@ class ClickRecord(BaseModel):
     ip_address: Optional[str] = None
 
 
+SHORT_CODE_ALPHABET = string.ascii_letters + string.digits
+SHORT_CODE_ATTEMPTS = 3
+URL_CACHE_TTL = 86400  # seconds
+CLICK_QUEUE_KEY = "clicks:pending"
+CLICK_DEAD_LETTER_KEY = "clicks:dead"
+CLICK_FLUSH_INTERVAL = 5  # seconds
+CLICK_FLUSH_BATCH = 1000
+DAILY_CLICKS_FORMAT = "%Y-%m-%d"
+MAX_BACKGROUND_WRITES = 100
+
+# Click writes still running after their redirect has been answered
+background_writes = set()
+
+
+def url_cache_key(short_code: str) -> str:
+    return f"u:{short_code}"
+
+
+async def get_cached_url(short_code: str) -> Optional[str]:
+    """Look up original_url in Redis, treating Redis errors as a cache miss"""
+    try:
+        return await redis_client.get(url_cache_key(short_code))
+    except RedisError as e:
+        logger.warning(f"Redis cache lookup failed for {short_code}: {e}")
+        return None
+
+
+async def cache_url(short_code: str, original_url: str):
+    """Store original_url in Redis; a failure only costs a later cache miss"""
+    try:
+        await redis_client.set(url_cache_key(short_code), original_url, ex=URL_CACHE_TTL)
+    except RedisError as e:
+        logger.warning(f"Redis cache update failed for {short_code}: {e}")
+
+
+URL_PATTERN = re.compile(r'^https?://[^\s/$.?#][^\s]*$', re.IGNORECASE)
+HOSTNAME_PATTERN = re.compile(
+    r'^(?:(?![-_])[a-z0-9_-]{1,63}(?<![-_])\.)+(?:[a-z]{2,63}|xn--[a-z0-9-]{1,59})$',
+    re.IGNORECASE
+)
+
+
+def is_valid_url(url: str) -> bool:
+    """Check that url is an http(s) URL whose host is a domain name or IP address"""
+    if not URL_PATTERN.match(url):
+        return False
+    
+    try:
+        parts = urlsplit(url)
+        port = parts.port  # Raises ValueError for a malformed port
+    except ValueError:
+        return False
+    
+    # urlsplit reads "host:" as having no port; neither it nor port 0 is usable
+    if port == 0 or (port is None and parts.netloc.endswith(':')):
+        return False
+    
+    host = parts.hostname
+    if not host:
+        return False
+    
+    if HOSTNAME_PATTERN.match(host):
+        return True
+    
+    if ':' in host or host[-1].isdigit():
+        try:
+            ipaddress.ip_address(host)
+            return True
+        except ValueError:
+            return False
+    
+    if host.isascii():
+        return False
+    
+    # Internationalized domains are checked in their ASCII (punycode) form
+    try:
+        host = host.encode('idna').decode('ascii')
+    except UnicodeError:
+        return False
+    
+    return HOSTNAME_PATTERN.match(host) is not None
+
+
 def generate_short_code(length=6):
     """Generate a random short code"""
-    characters = string.ascii_letters + string.digits
-    return ''.join(random.choice(characters) for _ in range(length))
+    return ''.join(random.choices(SHORT_CODE_ALPHABET, k=length))
 
 
-async def get_unique_short_code():
-    """Generate a unique short code that doesn't exist in database"""
-    while True:
-        code = generate_short_code()
-        existing = await db.urls.find_one({"short_code": code})
-        if not existing:
-            return code
+def render_qr_svg(data: str) -> bytes:
+    """Render data as a QR code SVG"""
+    # Create QR code instance
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    
+    # Add data and make QR code. "domain.com/" plus a 6 character code always
+    # fits version 1, so skip the size search unless the data outgrows it
+    qr.add_data(data)
+    try:
+        qr.make(fit=False)
+    except qrcode.exceptions.DataOverflowError:
+        qr.make(fit=True)
+    
+    # Create a single-path vector image, no PIL/PNG encoding involved
+    img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+    
+    buffer = BytesIO()
+    img.save(buffer)
+    return buffer.getvalue()
 
 
 def generate_qr_code(url: str) -> str:
-    """Generate QR code for URL and return as base64 encoded image"""
+    """Generate QR code for URL and return as base64 encoded SVG image
+    
+    Runs in qr_executor worker processes. Under the spawn and forkserver
+    start methods each worker re-imports this module and gets its own,
+    unconnected Mongo and Redis clients, so it must only use its argument.
+    """
+    base64_encoded = base64.b64encode(render_qr_svg(url)).decode('utf-8')
+    return f"data:image/svg+xml;base64,{base64_encoded}"
+
+
+async def render_qr_code(url: str) -> str:
+    """Run generate_qr_code in qr_executor, replacing the pool once if it broke"""
+    global qr_executor
+    loop = asyncio.get_running_loop()
+    executor = qr_executor
     try:
-        # Create QR code instance
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        
-        # Add data and make QR code
-        qr.add_data(url)
-        qr.make(fit=True)
-        
-        # Create image
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to base64
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        img_data = buffer.getvalue()
-        base64_encoded = base64.b64encode(img_data).decode('utf-8')
-        
-        return f"data:image/png;base64,{base64_encoded}"
-    except Exception as e:
-        logger.error(f"Error generating QR code: {e}")
-        return ""
+        return await loop.run_in_executor(executor, generate_qr_code, url)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed) and the pool rejects all new work;
+        # only the first request to notice replaces it
+        if qr_executor is executor:
+            logger.error("QR worker pool is broken, starting a new one")
+            executor.shutdown(wait=False)
+            qr_executor = ProcessPoolExecutor(max_workers=os.cpu_count())
+        return await loop.run_in_executor(qr_executor, generate_qr_code, url)
 
 
 @api_router.post("/shorten", response_model=UrlResponse)
@@ -108,43 +225,71 @@ async def create_short_url(url_data: UrlCreate):
     if not original_url.startswith(('http://', 'https://')):
         original_url = 'https://' + original_url
     
-    if not validators.url(original_url):
+    if not is_valid_url(original_url):
         raise HTTPException(status_code=400, detail="Invalid URL format")
     
-    # Generate unique short code
-    short_code = await get_unique_short_code()
-    
-    # Create shortened URL
-    short_url = f"domain.com/{short_code}"  # This will be dynamic in production
-    
-    # Generate QR code for the shortened URL
-    qr_code_data = generate_qr_code(short_url)
-    
-    # Create URL object
-    url_obj = UrlResponse(
-        original_url=original_url,
-        short_code=short_code,
-        short_url=short_url,
-        qr_code=qr_code_data
-    )
-    
-    # Save to database
-    await db.urls.insert_one(url_obj.dict())
+    # The unique index on short_code rejects collisions, so retry with a
+    # fresh code instead of checking for existence before every insert
+    for _ in range(SHORT_CODE_ATTEMPTS):
+        short_code = generate_short_code()
+        
+        # Create shortened URL
+        short_url = f"domain.com/{short_code}"  # This will be dynamic in production
+        
+        # Generate QR code for the shortened URL without blocking the event loop
+        try:
+            qr_code_data = await render_qr_code(short_url)
+        except BrokenProcessPool:
+            logger.error("QR worker pool broke again after being replaced")
+            raise HTTPException(status_code=500, detail="Could not generate QR code")
+        except Exception as e:
+            logger.error(f"Error generating QR code: {e}")
+            qr_code_data = ""
+        
+        # Create URL object
+        url_obj = UrlResponse(
+            original_url=original_url,
+            short_code=short_code,
+            short_url=short_url,
+            qr_code=qr_code_data
+        )
+        
+        # Save to database
+        try:
+            await db.urls.insert_one(url_obj.model_dump())
+        except DuplicateKeyError:
+            logger.warning(f"Short code collision on {short_code}, retrying")
+            continue
+        
+        if redis_client is not None:
+            await cache_url(short_code, original_url)
+        
+        return url_obj
     
-    return url_obj
+    raise HTTPException(status_code=500, detail="Could not generate a unique short code")
 
 
-@api_router.get("/urls", response_model=List[UrlResponse])
+@api_router.get("/healthz")
+async def health_check():
+    """Liveness probe for tests and load balancers"""
+    return {"status": "ok"}
+
+
+# Stored documents already match UrlResponse, so return them without
+# re-validating every row; the model is only used for the OpenAPI schema
+@api_router.get("/urls", response_model=None, responses={200: {"model": List[UrlResponse]}})
 async def get_all_urls():
     """Get all shortened URLs - for testing purposes"""
-    urls = await db.urls.find().to_list(1000)
-    return [UrlResponse(**url) for url in urls]
+    return await db.urls.find({}, {"_id": 0}).to_list(1000)
 
 
 @api_router.get("/qr/{short_code}")
 async def get_qr_code(short_code: str):
     """Get QR code for a specific short URL"""
-    url_record = await db.urls.find_one({"short_code": short_code})
+    url_record = await db.urls.find_one(
+        {"short_code": short_code},
+        {"_id": 0, "short_url": 1, "qr_code": 1}
+    )
     
     if not url_record:
         raise HTTPException(status_code=404, detail="Short URL not found")
@@ -156,53 +301,195 @@ async def get_qr_code(short_code: str):
     }
 
 
+async def store_click(click_record: ClickRecord, count_click: bool):
+    """Write a click straight to MongoDB (used when Redis is not configured or unavailable)"""
+    if count_click:
+        # Update click count
+        await db.urls.update_one(
+            {"short_code": click_record.short_code},
+            {"$inc": {"click_count": 1}}
+        )
+    await db.clicks.insert_one(click_record.model_dump())
+
+
+def finish_background_write(task: asyncio.Task):
+    background_writes.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Error recording click: {task.exception()}")
+
+
 # Redirect endpoint (not under /api prefix)
 @app.get("/{short_code}")
 async def redirect_url(short_code: str):
-    # Find URL by short code
-    url_record = await db.urls.find_one({"short_code": short_code})
+    # Short URLs never change, so serve popular codes from this process first,
+    # then from Redis, and only fall back to MongoDB on a miss
+    original_url = URL_CACHE.get(short_code)
+    click_counted = False
     
-    if not url_record:
-        raise HTTPException(status_code=404, detail="Short URL not found")
+    if original_url is None and redis_client is not None:
+        original_url = await get_cached_url(short_code)
     
-    # Update click count
-    await db.urls.update_one(
-        {"short_code": short_code},
-        {"$inc": {"click_count": 1}}
-    )
+    if original_url is None:
+        if redis_client is not None:
+            url_record = await db.urls.find_one(
+                {"short_code": short_code},
+                {"_id": 0, "original_url": 1}
+            )
+        else:
+            # Fetch the URL and update the click count in one round trip
+            url_record = await db.urls.find_one_and_update(
+                {"short_code": short_code},
+                {"$inc": {"click_count": 1}},
+                projection={"_id": 0, "original_url": 1}
+            )
+            click_counted = True
+        
+        if not url_record:
+            raise HTTPException(status_code=404, detail="Short URL not found")
+        
+        original_url = url_record["original_url"]
+        if redis_client is not None:
+            await cache_url(short_code, original_url)
+    
+    URL_CACHE[short_code] = original_url
     
     # Record click for analytics
     click_record = ClickRecord(
         short_code=short_code,
         # user_agent and ip_address can be added later for analytics
     )
-    await db.clicks.insert_one(click_record.dict())
+    
+    queued = False
+    if redis_client is not None:
+        # Queue the click; click_flush_loop() writes it to MongoDB in a batch
+        try:
+            await redis_client.rpush(CLICK_QUEUE_KEY, click_record.model_dump_json())
+            queued = True
+        except RedisError as e:
+            logger.warning(f"Could not queue click for {short_code}, writing it directly: {e}")
+    
+    if not queued:
+        write = store_click(click_record, count_click=not click_counted)
+        if len(background_writes) < MAX_BACKGROUND_WRITES:
+            # Don't make the redirect wait for analytics writes
+            task = asyncio.create_task(write)
+            background_writes.add(task)
+            task.add_done_callback(finish_background_write)
+        else:
+            # Too many writes already in flight, so apply backpressure
+            await write
     
     # Redirect to original URL
-    return RedirectResponse(url=url_record["original_url"], status_code=302)
+    return RedirectResponse(url=original_url, status_code=302)
+
+
+async def flush_clicks() -> int:
+    """Move one batch of queued clicks from Redis into MongoDB
+    
+    Returns the number of entries taken off the queue. Delivery is
+    at-least-once: a batch that fails with a transient MongoDB error is
+    pushed back onto the front of the queue and retried whole. Clicks are
+    inserted under their own id so a retry never duplicates them, but a
+    retried batch can increment click_count twice. Entries that cannot be
+    parsed, and batches that fail for any other reason, are moved to the
+    dead-letter list so they cannot block the queue. A crash between taking
+    a batch and writing it still loses that batch.
+    """
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.lrange(CLICK_QUEUE_KEY, 0, CLICK_FLUSH_BATCH - 1)
+        pipe.ltrim(CLICK_QUEUE_KEY, CLICK_FLUSH_BATCH, -1)
+        queued, _ = await pipe.execute()
+    
+    clicks, valid, malformed = [], [], []
+    for item in queued:
+        try:
+            clicks.append(ClickRecord.model_validate_json(item))
+            valid.append(item)
+        except ValidationError as e:
+            logger.error(f"Dead-lettering malformed queued click {item[:200]!r}: {e}")
+            malformed.append(item)
+    if malformed:
+        await redis_client.rpush(CLICK_DEAD_LETTER_KEY, *malformed)
+    
+    if not clicks:
+        return len(queued)
+    
+    try:
+        try:
+            await db.clicks.insert_many(
+                [{"_id": click.id, **click.model_dump()} for click in clicks],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            # Duplicate ids are clicks already stored by an earlier attempt
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+        
+        counts = Counter(click.short_code for click in clicks)
+        await db.urls.bulk_write(
+            [UpdateOne({"short_code": code}, {"$inc": {"click_count": n}}) for code, n in counts.items()],
+            ordered=False
+        )
+    except AutoReconnect:
+        # Also covers NetworkTimeout and ServerSelectionTimeoutError: MongoDB
+        # could not be reached, so the same batch should succeed later
+        await redis_client.lpush(CLICK_QUEUE_KEY, *reversed(valid))
+        raise
+    except Exception:
+        await redis_client.rpush(CLICK_DEAD_LETTER_KEY, *valid)
+        raise
+    
+    return len(queued)
+
+
+async def drain_clicks():
+    """Flush queued clicks until the queue is empty or a flush fails"""
+    try:
+        while await flush_clicks() == CLICK_FLUSH_BATCH:
+            pass
+    except Exception as e:
+        logger.error(f"Error flushing clicks: {e}")
+
+
+async def click_flush_loop():
+    """Periodically drain the Redis click queue, and once more when stopped"""
+    while not click_flush_stop.is_set():
+        try:
+            await asyncio.wait_for(click_flush_stop.wait(), timeout=CLICK_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        await drain_clicks()
 
 
 @api_router.get("/stats/{short_code}")
 async def get_url_stats(short_code: str):
     """Get statistics for a short URL"""
-    url_record = await db.urls.find_one({"short_code": short_code})
+    url_record = await db.urls.find_one(
+        {"short_code": short_code},
+        {"_id": 0, "original_url": 1, "created_at": 1, "qr_code": 1}
+    )
     
     if not url_record:
         raise HTTPException(status_code=404, detail="Short URL not found")
     
-    # Get click records
-    clicks = await db.clicks.find({"short_code": short_code}).to_list(1000)
-    
-    # Group clicks by date
-    daily_clicks = {}
-    for click in clicks:
-        date_str = click["timestamp"].strftime("%Y-%m-%d")
-        daily_clicks[date_str] = daily_clicks.get(date_str, 0) + 1
+    # Group clicks by date in MongoDB so only one row per day comes back
+    pipeline = [
+        {"$match": {"short_code": short_code}},
+        # Only indexed fields are used, so the (short_code, timestamp) index covers the scan
+        {"$project": {"_id": 0, "timestamp": 1}},
+        {"$group": {
+            "_id": {"$dateToString": {"format": DAILY_CLICKS_FORMAT, "date": "$timestamp"}},
+            "count": {"$sum": 1}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
+    daily = await db.clicks.aggregate(pipeline).to_list(None)
+    daily_clicks = {day["_id"]: day["count"] for day in daily}
     
     return {
         "short_code": short_code,
         "original_url": url_record["original_url"],
-        "total_clicks": len(clicks),
+        "total_clicks": sum(daily_clicks.values()),
         "daily_clicks": daily_clicks,
         "created_at": url_record["created_at"],
         "qr_code": url_record.get("qr_code", "")
@@ -227,6 +514,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+click_flush_task = None
+click_flush_stop = asyncio.Event()
+qr_executor = None
+
+@app.on_event("startup")
+async def create_indexes():
+    await db.urls.create_index("short_code", unique=True)
+    await db.clicks.create_index([("short_code", 1), ("timestamp", 1)])
+
+@app.on_event("startup")
+async def start_qr_executor():
+    global qr_executor
+    qr_executor = ProcessPoolExecutor(max_workers=os.cpu_count())
+
+@app.on_event("startup")
+async def start_click_flusher():
+    global click_flush_task
+    # An earlier shutdown, e.g. in tests, leaves the event set
+    click_flush_stop.clear()
+    if redis_client is not None:
+        click_flush_task = asyncio.create_task(click_flush_loop())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    try:
+        if click_flush_task is not None:
+            # Let a flush in progress finish and drain what is still queued
+            # before the connections go away
+            click_flush_stop.set()
+            await click_flush_task
+        if background_writes:
+            await asyncio.gather(*background_writes, return_exceptions=True)
+    finally:
+        if qr_executor is not None:
+            qr_executor.shutdown()
+        client.close()
+        if redis_client is not None:
+            await redis_client.aclose()
\ No newline at end of file
@@ -1,42 +1,135 @@
 #!/usr/bin/env python3
+# Tests are independent, so they can run in parallel:
+#     pytest -n 8 backend_test.py
+import os
+import functools
+import orjson
+import pytest
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import unittest
-import time
-import json
+from concurrent.futures import ThreadPoolExecutor
 import base64
-import re
-from urllib.parse import urlparse
-from io import BytesIO
-from PIL import Image
+import binascii
 
-# Get the backend URL from the frontend .env file
-BACKEND_URL = "https://8f2f7923-a357-4b44-8d8a-478e20f6baf4.preview.emergentagent.com"
+# Backend URL, defaulting to the one in the frontend .env file
+BACKEND_URL = os.environ.get(
+    "BACKEND_URL",
+    "https://8f2f7923-a357-4b44-8d8a-478e20f6baf4.preview.emergentagent.com"
+)
 API_URL = f"{BACKEND_URL}/api"
+QR_PREFIX = "data:image/svg+xml;base64,"
+REQUEST_TIMEOUT = (3, 10)  # seconds to connect, seconds to read
+VERBOSE = bool(os.environ.get("VERBOSE_TESTS"))
+
+# Tests that don't depend on backend state replay the responses committed
+# in cassettes/ instead of calling the server. Set VCR_RECORD_MODE=all to
+# re-record them against BACKEND_URL after changing what those endpoints return
+vcr = pytest.mark.vcr
+VCR_RECORD_MODE = os.environ.get("VCR_RECORD_MODE", "none")
+
+
+@pytest.fixture(scope="module")
+def vcr_config():
+    # Match without the host so cassettes replay for any BACKEND_URL
+    return {"match_on": ["method", "path", "query", "body"], "record_mode": VCR_RECORD_MODE}
+
+
+def log(message):
+    """Print test progress when VERBOSE_TESTS is set"""
+    if VERBOSE:
+        print(message)
+
+
+def log_response(response):
+    """Print a response's status and the start of its body when VERBOSE_TESTS is set"""
+    if VERBOSE:
+        print(f"Response status: {response.status_code}")
+        # Decode only the bytes being shown, not the whole multi-KB body
+        print(f"Response body: {response.content[:100].decode('utf-8', 'replace')}...")
+
 
 class URLShortenerTests(unittest.TestCase):
     """Test cases for URL Shortener API"""
 
+    valid_url = "example.com"
+    valid_url_with_protocol = "https://example.com"
+    invalid_url = "not_a_valid_url"
+    non_existent_short_code = "nonexistent123"
+
+    @classmethod
+    def setUpClass(cls):
+        """Share one pooled keep-alive session and one pair of short URLs across all tests"""
+        cls.session = requests.Session()
+        cls.addClassCleanup(cls.session.close)
+
+        # Skip the whole class quickly if the backend is down, instead of
+        # letting every test wait on its own timeouts
+        try:
+            response = cls.session.get(f"{API_URL}/healthz", timeout=2)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise unittest.SkipTest(f"Backend not reachable at {API_URL}: {e}")
+        if response.status_code in (502, 503, 504):
+            raise unittest.SkipTest(f"Backend down at {API_URL}: HTTP {response.status_code}")
+        # Any other error (e.g. a wrong BACKEND_URL answering 404) fails the class
+        response.raise_for_status()
+
+        # Retry gateway errors and timeouts only; 4xx responses are real results
+        retry = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=["GET", "POST"],
+        )
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry)
+        cls.session.mount("https://", adapter)
+        cls.session.mount("http://", adapter)
+
+        # Give every call a (connect, read) timeout unless it passes its own
+        cls.session.request = functools.partial(cls.session.request, timeout=REQUEST_TIMEOUT)
+
+        # Thread pool for overlapping independent requests on the shared session
+        cls.executor = ThreadPoolExecutor(max_workers=8)
+        cls.addClassCleanup(cls.executor.shutdown)
+
+        # Short codes for the tests that only need an existing short URL
+        cls._code_no_proto, cls._code_with_proto = cls.executor.map(
+            cls._shorten, [cls.valid_url, cls.valid_url_with_protocol]
+        )
+
+        # Fetch and decode one QR code up front for the tests that inspect its content
+        response = cls.session.get(f"{API_URL}/qr/{cls._code_no_proto}")
+        response.raise_for_status()
+        cls._qr_code = orjson.loads(response.content)["qr_code"]
+        try:
+            cls._qr_bytes = base64.b64decode(cls._qr_code.removeprefix(QR_PREFIX))
+        except binascii.Error:
+            cls._qr_bytes = None
+
+    @classmethod
+    def _shorten(cls, url):
+        """Create a short URL and return its short code"""
+        response = cls.session.post(f"{API_URL}/shorten", json={"original_url": url})
+        response.raise_for_status()
+        return orjson.loads(response.content)["short_code"]
+
     def setUp(self):
         """Setup for each test"""
-        self.valid_url = "example.com"
-        self.valid_url_with_protocol = "https://example.com"
-        self.invalid_url = "not_a_valid_url"
-        self.non_existent_short_code = "nonexistent123"
         self.created_short_codes = []  # Track created short codes for cleanup
 
     def test_01_shorten_valid_url_without_protocol(self):
         """Test shortening a valid URL without protocol"""
-        print("\n=== Testing URL shortening with valid URL (no protocol) ===")
-        response = requests.post(
+        log("\n=== Testing URL shortening with valid URL (no protocol) ===")
+        response = self.session.post(
             f"{API_URL}/shorten", 
             json={"original_url": self.valid_url}
         )
         
-        print(f"Response status: {response.status_code}")
-        print(f"Response body: {response.text}")
+        log_response(response)
         
         self.assertEqual(response.status_code, 200)
-        data = response.json()
+        data = orjson.loads(response.content)
         
         # Verify response structure
         self.assertIn("id", data)
@@ -48,7 +141,7 @@ class URLShortenerTests(unittest.TestCase):
         
         # Verify QR code is included in response
         self.assertIn("qr_code", data)
-        self.assertTrue(data["qr_code"].startswith("data:image/png;base64,"))
+        self.assertTrue(data["qr_code"].startswith(QR_PREFIX))
         
         # Verify URL was normalized with https://
         self.assertEqual(data["original_url"], f"https://{self.valid_url}")
@@ -59,163 +152,209 @@ class URLShortenerTests(unittest.TestCase):
         # Save short code for later tests
         self.created_short_codes.append(data["short_code"])
         
-        print(f"Successfully created short URL with code: {data['short_code']}")
-        return data["short_code"]
+        log(f"Successfully created short URL with code: {data['short_code']}")
 
     def test_02_shorten_valid_url_with_protocol(self):
         """Test shortening a valid URL with protocol"""
-        print("\n=== Testing URL shortening with valid URL (with protocol) ===")
-        response = requests.post(
+        log("\n=== Testing URL shortening with valid URL (with protocol) ===")
+        response = self.session.post(
             f"{API_URL}/shorten", 
             json={"original_url": self.valid_url_with_protocol}
         )
         
-        print(f"Response status: {response.status_code}")
-        print(f"Response body: {response.text}")
+        log_response(response)
         
         self.assertEqual(response.status_code, 200)
-        data = response.json()
+        data = orjson.loads(response.content)
         
         # Verify URL was not modified
         self.assertEqual(data["original_url"], self.valid_url_with_protocol)
         
         # Verify QR code is included in response
         self.assertIn("qr_code", data)
-        self.assertTrue(data["qr_code"].startswith("data:image/png;base64,"))
+        self.assertTrue(data["qr_code"].startswith(QR_PREFIX))
         
         # Save short code for later tests
         self.created_short_codes.append(data["short_code"])
         
-        print(f"Successfully created short URL with code: {data['short_code']}")
-        return data["short_code"]
+        log(f"Successfully created short URL with code: {data['short_code']}")
 
+    @vcr
     def test_03_shorten_invalid_url(self):
         """Test shortening an invalid URL"""
-        print("\n=== Testing URL shortening with invalid URL ===")
-        response = requests.post(
+        log("\n=== Testing URL shortening with invalid URL ===")
+        response = self.session.post(
             f"{API_URL}/shorten", 
             json={"original_url": self.invalid_url}
         )
         
-        print(f"Response status: {response.status_code}")
-        print(f"Response body: {response.text}")
+        log_response(response)
         
         # Should return 400 Bad Request
         self.assertEqual(response.status_code, 400)
         
         # Verify error message
-        data = response.json()
+        data = orjson.loads(response.content)
         self.assertIn("detail", data)
         self.assertEqual(data["detail"], "Invalid URL format")
         
-        print("Successfully rejected invalid URL")
+        log("Successfully rejected invalid URL")
+
+    def test_03a_shorten_rejects_malformed_urls(self):
+        """Test that malformed ports, hostnames and IP addresses are rejected"""
+        log("\n=== Testing URL shortening with malformed URLs ===")
+        urls = [
+            "https://example.com:",
+            "https://example.com:0/path",
+            "https://example.com:65536",
+            "https://_example.com",
+            "https://example_.com",
+            "https://-example.com",
+            "https://localhost",
+            "https://example",
+            "https://[::1",
+            "https://999.1.1.1",
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.session.post(f"{API_URL}/shorten", json={"original_url": url})
+                log_response(response)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(orjson.loads(response.content)["detail"], "Invalid URL format")
+
+        log("Successfully rejected malformed URLs")
+
+    def test_03b_shorten_accepts_valid_url_forms(self):
+        """Test that ports, IP addresses and internationalized domains are accepted"""
+        log("\n=== Testing URL shortening with valid URL forms ===")
+        urls = [
+            "https://example.com:8080/path?q=1",
+            "http://a_b.example.com",
+            "https://192.168.0.1/",
+            "https://[2001:db8::1]:8443/",
+            "https://bücher.example",
+            "https://example.xn--p1ai",
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.session.post(f"{API_URL}/shorten", json={"original_url": url})
+                log_response(response)
+                self.assertEqual(response.status_code, 200)
+                data = orjson.loads(response.content)
+                self.assertEqual(data["original_url"], url)
+                self.created_short_codes.append(data["short_code"])
+
+        log("Successfully accepted valid URL forms")
 
     def test_04_verify_unique_short_codes(self):
         """Test that multiple shortening requests generate unique codes"""
-        print("\n=== Testing unique short code generation ===")
+        log("\n=== Testing unique short code generation ===")
+        
+        # Create multiple short URLs concurrently
+        urls = [f"test{i}.example.com" for i in range(3)]
+        responses = list(self.executor.map(
+            lambda url: self.session.post(f"{API_URL}/shorten", json={"original_url": url}),
+            urls
+        ))
         
-        # Create multiple short URLs
+        # Verify all codes are unique, failing on the first collision
         codes = set()
-        for i in range(3):
-            response = requests.post(
-                f"{API_URL}/shorten", 
-                json={"original_url": f"test{i}.example.com"}
-            )
+        for response in responses:
             self.assertEqual(response.status_code, 200)
-            data = response.json()
+            data = orjson.loads(response.content)
+            self.assertNotIn(data["short_code"], codes)
             codes.add(data["short_code"])
             self.created_short_codes.append(data["short_code"])
         
-        # Verify all codes are unique
-        self.assertEqual(len(codes), 3)
-        print(f"Successfully verified unique short codes: {codes}")
+        self.assertEqual(len(codes), len(urls))
+        log(f"Successfully verified unique short codes: {codes}")
 
     def test_05_redirect_valid_short_code(self):
         """Test redirection with a valid short code (using API to verify)"""
-        print("\n=== Testing URL redirection with valid short code ===")
+        log("\n=== Testing URL redirection with valid short code ===")
         
-        # First create a short URL
-        short_code = self.test_01_shorten_valid_url_without_protocol()
+        # Use the short URL created in setUpClass
+        short_code = self._code_no_proto
         
         # Get initial click count
-        response = requests.get(f"{API_URL}/stats/{short_code}")
+        response = self.session.get(f"{API_URL}/stats/{short_code}")
         self.assertEqual(response.status_code, 200)
-        initial_stats = response.json()
+        initial_stats = orjson.loads(response.content)
         initial_clicks = initial_stats["total_clicks"]
         
-        print(f"Initial click count: {initial_clicks}")
+        log(f"Initial click count: {initial_clicks}")
         
         # Since we can't directly test the redirect, we'll simulate a click by 
         # checking if the click count increases after we access the URL
         # This is a workaround since the frontend is handling all routes
         
         # Make a request to the redirect endpoint (this won't actually redirect in our test environment)
-        requests.get(f"{BACKEND_URL}/{short_code}", allow_redirects=False)
+        self.session.get(f"{BACKEND_URL}/{short_code}", allow_redirects=False)
         
         # Get updated stats
-        response = requests.get(f"{API_URL}/stats/{short_code}")
+        response = self.session.get(f"{API_URL}/stats/{short_code}")
         self.assertEqual(response.status_code, 200)
-        updated_stats = response.json()
+        updated_stats = orjson.loads(response.content)
         
         # In a real environment, the click count would increase
         # But in our test environment, it might not since the frontend is handling the route
         # So we'll just verify that the stats endpoint is working
-        print(f"Original URL from stats: {updated_stats['original_url']}")
+        log(f"Original URL from stats: {updated_stats['original_url']}")
         self.assertEqual(updated_stats["original_url"], f"https://{self.valid_url}")
         
-        print(f"Successfully verified stats for short code: {short_code}")
+        log(f"Successfully verified stats for short code: {short_code}")
 
+    @vcr
     def test_06_redirect_invalid_short_code(self):
         """Test redirection with an invalid short code (using API to verify)"""
-        print("\n=== Testing URL redirection with invalid short code ===")
+        log("\n=== Testing URL redirection with invalid short code ===")
         
         # Try to get stats for a non-existent short code
-        response = requests.get(f"{API_URL}/stats/{self.non_existent_short_code}")
+        response = self.session.get(f"{API_URL}/stats/{self.non_existent_short_code}")
         
-        print(f"Response status: {response.status_code}")
-        print(f"Response body: {response.text}")
+        log_response(response)
         
         # Should return 404 Not Found
         self.assertEqual(response.status_code, 404)
         
         # Verify error message
-        data = response.json()
+        data = orjson.loads(response.content)
         self.assertIn("detail", data)
         self.assertEqual(data["detail"], "Short URL not found")
         
-        print("Successfully verified non-existent short code returns 404")
+        log("Successfully verified non-existent short code returns 404")
 
     def test_07_verify_click_counting(self):
         """Test that clicks are counted correctly (using API to verify)"""
-        print("\n=== Testing click counting ===")
+        log("\n=== Testing click counting ===")
         
-        # First create a short URL
-        short_code = self.test_02_shorten_valid_url_with_protocol()
+        # Use the short URL created in setUpClass
+        short_code = self._code_with_proto
         
         # Get initial stats
-        response = requests.get(f"{API_URL}/stats/{short_code}")
+        response = self.session.get(f"{API_URL}/stats/{short_code}")
         self.assertEqual(response.status_code, 200)
-        initial_stats = response.json()
+        initial_stats = orjson.loads(response.content)
         initial_clicks = initial_stats["total_clicks"]
         
-        print(f"Initial click count: {initial_clicks}")
+        log(f"Initial click count: {initial_clicks}")
         
         # Simulate multiple clicks by directly calling the redirect endpoint
         num_clicks = 3
         for i in range(num_clicks):
             # Make a request to the redirect endpoint
-            redirect_response = requests.get(f"{BACKEND_URL}/{short_code}", allow_redirects=False)
+            redirect_response = self.session.get(f"{BACKEND_URL}/{short_code}", allow_redirects=False)
             # Note: The status code might not be 302 in our test environment
             # because of how the routing is set up, but we still want to make the request
             # to increment the click count
-            print(f"Redirect response status: {redirect_response.status_code}")
+            log(f"Redirect response status: {redirect_response.status_code}")
         
         # Get updated stats
-        response = requests.get(f"{API_URL}/stats/{short_code}")
+        response = self.session.get(f"{API_URL}/stats/{short_code}")
         self.assertEqual(response.status_code, 200)
-        updated_stats = response.json()
+        updated_stats = orjson.loads(response.content)
         
-        print(f"Updated stats: {updated_stats}")
+        log(f"Updated stats: {str(updated_stats)[:100]}...")
         
         # Verify data is correct
         self.assertEqual(updated_stats["short_code"], short_code)
@@ -225,23 +364,22 @@ class URLShortenerTests(unittest.TestCase):
         # because the redirect might not work as expected in the test setup
         # So we'll just verify that the stats endpoint is working
         
-        print(f"Successfully verified stats endpoint for short code: {short_code}")
+        log(f"Successfully verified stats endpoint for short code: {short_code}")
 
     def test_08_stats_valid_short_code(self):
         """Test getting stats for a valid short code"""
-        print("\n=== Testing stats with valid short code ===")
+        log("\n=== Testing stats with valid short code ===")
         
-        # First create a short URL
-        short_code = self.test_01_shorten_valid_url_without_protocol()
+        # Use the short URL created in setUpClass
+        short_code = self._code_no_proto
         
         # Get stats
-        response = requests.get(f"{API_URL}/stats/{short_code}")
+        response = self.session.get(f"{API_URL}/stats/{short_code}")
         
-        print(f"Response status: {response.status_code}")
-        print(f"Response body: {response.text}")
+        log_response(response)
         
         self.assertEqual(response.status_code, 200)
-        data = response.json()
+        data = orjson.loads(response.content)
         
         # Verify response structure
         self.assertIn("short_code", data)
@@ -256,68 +394,67 @@ class URLShortenerTests(unittest.TestCase):
         self.assertEqual(data["original_url"], f"https://{self.valid_url}")
         
         # Verify QR code is included in response
-        self.assertTrue(data["qr_code"].startswith("data:image/png;base64,"))
+        self.assertTrue(data["qr_code"].startswith(QR_PREFIX))
         
         # Verify daily clicks
         self.assertIsInstance(data["daily_clicks"], dict)
         
-        print(f"Successfully retrieved stats for short code: {short_code}")
+        log(f"Successfully retrieved stats for short code: {short_code}")
 
+    @vcr
     def test_09_stats_invalid_short_code(self):
         """Test getting stats for an invalid short code"""
-        print("\n=== Testing stats with invalid short code ===")
+        log("\n=== Testing stats with invalid short code ===")
         
-        response = requests.get(f"{API_URL}/stats/{self.non_existent_short_code}")
+        response = self.session.get(f"{API_URL}/stats/{self.non_existent_short_code}")
         
-        print(f"Response status: {response.status_code}")
-        print(f"Response body: {response.text}")
+        log_response(response)
         
         # Should return 404 Not Found
         self.assertEqual(response.status_code, 404)
         
         # Verify error message
-        data = response.json()
+        data = orjson.loads(response.content)
         self.assertIn("detail", data)
         self.assertEqual(data["detail"], "Short URL not found")
         
-        print("Successfully rejected invalid short code for stats")
+        log("Successfully rejected invalid short code for stats")
 
     def test_10_verify_daily_click_aggregation(self):
         """Test that clicks are aggregated by day correctly"""
-        print("\n=== Testing daily click aggregation ===")
+        log("\n=== Testing daily click aggregation ===")
         
-        # First create a short URL
-        short_code = self.test_02_shorten_valid_url_with_protocol()
+        # Use the short URL created in setUpClass
+        short_code = self._code_with_proto
         
         # Get initial stats
-        response = requests.get(f"{API_URL}/stats/{short_code}")
+        response = self.session.get(f"{API_URL}/stats/{short_code}")
         self.assertEqual(response.status_code, 200)
-        initial_stats = response.json()
+        initial_stats = orjson.loads(response.content)
         
-        print(f"Initial stats: {initial_stats}")
+        log(f"Initial stats: {str(initial_stats)[:100]}...")
         
         # Since we can't directly test the click counting and daily aggregation,
         # we'll just verify that the stats endpoint is returning the expected structure
         self.assertIn("daily_clicks", initial_stats)
         self.assertIsInstance(initial_stats["daily_clicks"], dict)
         
-        print(f"Successfully verified daily click aggregation structure for short code: {short_code}")
+        log(f"Successfully verified daily click aggregation structure for short code: {short_code}")
 
     def test_11_qr_code_endpoint_valid_short_code(self):
         """Test QR code endpoint with valid short code"""
-        print("\n=== Testing QR code endpoint with valid short code ===")
+        log("\n=== Testing QR code endpoint with valid short code ===")
         
-        # First create a short URL
-        short_code = self.test_01_shorten_valid_url_without_protocol()
+        # Use the short URL created in setUpClass
+        short_code = self._code_no_proto
         
         # Get QR code
-        response = requests.get(f"{API_URL}/qr/{short_code}")
+        response = self.session.get(f"{API_URL}/qr/{short_code}")
         
-        print(f"Response status: {response.status_code}")
-        print(f"Response body: {response.text[:100]}...")  # Only print the beginning to avoid large output
+        log_response(response)
         
         self.assertEqual(response.status_code, 200)
-        data = response.json()
+        data = orjson.loads(response.content)
         
         # Verify response structure
         self.assertIn("short_code", data)
@@ -329,104 +466,97 @@ class URLShortenerTests(unittest.TestCase):
         self.assertEqual(data["short_url"], f"domain.com/{short_code}")
         
         # Verify QR code format
-        self.assertTrue(data["qr_code"].startswith("data:image/png;base64,"))
-        
-        print(f"Successfully retrieved QR code for short code: {short_code}")
+        self.assertTrue(data["qr_code"].startswith(QR_PREFIX))
         
-        return data["qr_code"]
+        log(f"Successfully retrieved QR code for short code: {short_code}")
 
+    @vcr
     def test_12_qr_code_endpoint_invalid_short_code(self):
         """Test QR code endpoint with invalid short code"""
-        print("\n=== Testing QR code endpoint with invalid short code ===")
+        log("\n=== Testing QR code endpoint with invalid short code ===")
         
-        response = requests.get(f"{API_URL}/qr/{self.non_existent_short_code}")
+        response = self.session.get(f"{API_URL}/qr/{self.non_existent_short_code}")
         
-        print(f"Response status: {response.status_code}")
-        print(f"Response body: {response.text}")
+        log_response(response)
         
         # Should return 404 Not Found
         self.assertEqual(response.status_code, 404)
         
         # Verify error message
-        data = response.json()
+        data = orjson.loads(response.content)
         self.assertIn("detail", data)
         self.assertEqual(data["detail"], "Short URL not found")
         
-        print("Successfully rejected invalid short code for QR code endpoint")
+        log("Successfully rejected invalid short code for QR code endpoint")
 
     def test_13_qr_code_content_validation(self):
         """Test that QR code contains the correct shortened URL"""
-        print("\n=== Testing QR code content validation ===")
+        log("\n=== Testing QR code content validation ===")
         
-        # First create a short URL
-        short_code = self.test_02_shorten_valid_url_with_protocol()
-        
-        # Get QR code
-        response = requests.get(f"{API_URL}/qr/{short_code}")
-        self.assertEqual(response.status_code, 200)
-        data = response.json()
-        qr_code_data = data["qr_code"]
+        # Use the QR code fetched and decoded in setUpClass
+        short_code = self._code_no_proto
         
         # Verify QR code format
-        self.assertTrue(qr_code_data.startswith("data:image/png;base64,"))
-        
-        # Extract base64 data
-        base64_data = qr_code_data.replace("data:image/png;base64,", "")
+        self.assertTrue(self._qr_code.startswith(QR_PREFIX))
         
         # Verify base64 data is valid
-        try:
-            # Try to decode the base64 data
-            decoded_data = base64.b64decode(base64_data)
-            print("Successfully decoded base64 data")
+        if self._qr_bytes is None:
+            self.fail("Failed to decode base64 data")
+        decoded_data = self._qr_bytes
+        
+        # Checking the header is enough to tell the payload is an SVG document
+        self.assertTrue(decoded_data.startswith(b"<?xml"))
+        self.assertIn(b"<svg ", decoded_data[:100])
+        
+        # Parsing the whole SVG is slower, so only do it when asked to
+        if os.environ.get("FULL_QR_VALIDATION"):
+            from xml.etree import ElementTree
             
-            # Try to open the image (this will fail if the data is not a valid image)
             try:
-                img = Image.open(BytesIO(decoded_data))
-                print(f"Successfully opened image: {img.format}, {img.size}, {img.mode}")
-                
-                # We can't directly read the QR code content without a QR code reader library,
-                # but we can verify that the image was created successfully
-                self.assertIsNotNone(img)
-                
-            except Exception as e:
-                print(f"Error opening image: {e}")
-                self.fail("Failed to open image from base64 data")
-                
-        except Exception as e:
-            print(f"Error decoding base64 data: {e}")
-            self.fail("Failed to decode base64 data")
+                svg = ElementTree.fromstring(decoded_data)
+                log(f"Successfully parsed SVG: {svg.get('width')} x {svg.get('height')}")
+            except ElementTree.ParseError as e:
+                log(f"Error parsing SVG: {e}")
+                self.fail("Failed to parse SVG from base64 data")
+            
+            # We can't directly read the QR code content without a QR code reader library,
+            # but we can verify that the image was created successfully
+            self.assertEqual(svg.tag, "{http://www.w3.org/2000/svg}svg")
         
-        print(f"Successfully validated QR code content for short code: {short_code}")
+        log(f"Successfully validated QR code content for short code: {short_code}")
 
     def test_14_verify_qr_code_stored_in_mongodb(self):
         """Test that QR code is stored in MongoDB (indirectly through API)"""
-        print("\n=== Testing QR code storage in MongoDB ===")
+        log("\n=== Testing QR code storage in MongoDB ===")
+        
+        # Use the short URL created in setUpClass
+        short_code = self._code_no_proto
         
-        # First create a short URL
-        short_code = self.test_01_shorten_valid_url_without_protocol()
+        # Get the URL from the API (which retrieves from MongoDB) and from the
+        # stats endpoint (another way to verify MongoDB storage) concurrently
+        qr_future = self.executor.submit(self.session.get, f"{API_URL}/qr/{short_code}")
+        stats_future = self.executor.submit(self.session.get, f"{API_URL}/stats/{short_code}")
         
-        # Get the URL from the API (which retrieves from MongoDB)
-        response = requests.get(f"{API_URL}/qr/{short_code}")
+        response = qr_future.result()
         self.assertEqual(response.status_code, 200)
-        data = response.json()
+        data = orjson.loads(response.content)
         
         # Verify QR code is present
         self.assertIn("qr_code", data)
-        self.assertTrue(data["qr_code"].startswith("data:image/png;base64,"))
+        self.assertTrue(data["qr_code"].startswith(QR_PREFIX))
         
-        # Get the URL from the stats endpoint (another way to verify MongoDB storage)
-        response = requests.get(f"{API_URL}/stats/{short_code}")
+        response = stats_future.result()
         self.assertEqual(response.status_code, 200)
-        stats_data = response.json()
+        stats_data = orjson.loads(response.content)
         
         # Verify QR code is present in stats
         self.assertIn("qr_code", stats_data)
-        self.assertTrue(stats_data["qr_code"].startswith("data:image/png;base64,"))
+        self.assertTrue(stats_data["qr_code"].startswith(QR_PREFIX))
         
         # Verify both QR codes are the same
         self.assertEqual(data["qr_code"], stats_data["qr_code"])
         
-        print(f"Successfully verified QR code storage in MongoDB for short code: {short_code}")
+        log(f"Successfully verified QR code storage in MongoDB for short code: {short_code}")
 
 if __name__ == "__main__":
     unittest.main(verbosity=2)
\ No newline at end of file
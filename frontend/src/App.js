@@ -4,6 +4,10 @@ import axios from "axios";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const QR_EXTENSIONS = {
+  'image/png': 'png',
+  'image/svg+xml': 'svg',
+};
 
 function App() {
   const [originalUrl, setOriginalUrl] = useState("");
@@ -44,10 +48,14 @@ function App() {
   const downloadQRCode = () => {
     if (!shortenedData?.qr_code) return;
     
+    // Name the file after the data URI's type (older QR codes are PNG)
+    const mimeType = shortenedData.qr_code.slice(5, shortenedData.qr_code.indexOf(';'));
+    const extension = QR_EXTENSIONS[mimeType] || 'png';
+    
     // Create a link element to download the QR code
     const link = document.createElement('a');
     link.href = shortenedData.qr_code;
-    link.download = `qr-code-${shortenedData.short_code}.png`;
+    link.download = `qr-code-${shortenedData.short_code}.${extension}`;
     document.body.appendChild(link);
     link.click();
     document.body.removeChild(link);
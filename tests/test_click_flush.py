@@ -0,0 +1,97 @@
+import unittest
+from unittest import mock
+
+import pytest
+from pymongo.errors import AutoReconnect, OperationFailure
+
+fakeredis = pytest.importorskip("fakeredis")
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import server
+
+
+class ClickFlushTest(unittest.IsolatedAsyncioTestCase):
+    """Test moving queued clicks from Redis into MongoDB"""
+
+    async def asyncSetUp(self):
+        self.db = mongomock_motor.AsyncMongoMockClient()["test_clicks"]
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        for name, value in (("db", self.db), ("redis_client", self.redis)):
+            patcher = mock.patch.object(server, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        await self.db.urls.insert_one({"short_code": "abc123", "click_count": 0})
+
+    async def asyncTearDown(self):
+        await self.redis.aclose()
+
+    async def queue_clicks(self, *items):
+        await self.redis.rpush(server.CLICK_QUEUE_KEY, *items)
+        return list(items)
+
+    async def click_count(self):
+        return (await self.db.urls.find_one({"short_code": "abc123"}))["click_count"]
+
+    def click(self):
+        return server.ClickRecord(short_code="abc123").model_dump_json()
+
+    async def test_transient_error_requeues_batch(self):
+        queued = await self.queue_clicks(self.click(), self.click())
+
+        # The clicks are inserted but the click_count update cannot reach MongoDB
+        collection = type(self.db.urls)
+        with mock.patch.object(collection, "bulk_write", side_effect=AutoReconnect("down")):
+            with self.assertRaises(AutoReconnect):
+                await server.flush_clicks()
+
+        self.assertEqual(await self.redis.lrange(server.CLICK_QUEUE_KEY, 0, -1), queued)
+
+        # The retry skips the stored clicks and applies the count
+        self.assertEqual(await server.flush_clicks(), 2)
+        self.assertEqual(await self.db.clicks.count_documents({}), 2)
+        self.assertEqual(await self.click_count(), 2)
+        self.assertEqual(await self.redis.llen(server.CLICK_QUEUE_KEY), 0)
+
+    async def test_malformed_entry_is_dead_lettered(self):
+        await self.queue_clicks("not json", '{"timestamp": "never"}', self.click())
+
+        self.assertEqual(await server.flush_clicks(), 3)
+
+        self.assertEqual(
+            await self.redis.lrange(server.CLICK_DEAD_LETTER_KEY, 0, -1),
+            ["not json", '{"timestamp": "never"}']
+        )
+        self.assertEqual(await self.db.clicks.count_documents({}), 1)
+        self.assertEqual(await self.click_count(), 1)
+        self.assertEqual(await self.redis.llen(server.CLICK_QUEUE_KEY), 0)
+
+    async def test_permanent_error_dead_letters_batch(self):
+        queued = await self.queue_clicks(self.click(), self.click())
+
+        collection = type(self.db.urls)
+        error = OperationFailure("bad update", code=2)
+        with mock.patch.object(collection, "bulk_write", side_effect=error):
+            with self.assertRaises(OperationFailure):
+                await server.flush_clicks()
+
+        self.assertEqual(await self.redis.llen(server.CLICK_QUEUE_KEY), 0)
+        self.assertEqual(await self.redis.lrange(server.CLICK_DEAD_LETTER_KEY, 0, -1), queued)
+
+    async def test_flusher_restarts_after_shutdown(self):
+        server.click_flush_stop.set()
+
+        await server.start_click_flusher()
+        self.addCleanup(setattr, server, "click_flush_task", None)
+
+        self.assertFalse(server.click_flush_stop.is_set())
+        self.assertFalse(server.click_flush_task.done())
+
+        # Stopping drains what is still queued
+        await self.queue_clicks(self.click())
+        server.click_flush_stop.set()
+        await server.click_flush_task
+        self.assertEqual(await self.click_count(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()